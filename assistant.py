@@ -25,30 +25,55 @@ import math
 import random
 import re
 import requests
+import sys
 import weakref
 
 from center import CenterControl
-from collections import namedtuple
 from enum import Enum
-from functools import partial
+from functools import lru_cache, partial
 from intent import IntentClassifier
 from io import StringIO
-from gpt_utils import get_token_count, get_token_limit
+from gpt_utils import get_token_limit
 from kivy.clock import Clock, mainthread
+from kivy.core.window import Window
 from kivy.logger import Logger
 from normalize import capitalize_chess_coords, substitute_chess_moves, remove_san_notation
 from opening import Opening
 from puzzlelib import PuzzleCollection, puzzle_description
 from puzzlelib import themes_dict as puzzle_themes
+from rapidfuzz.fuzz import ratio
+from rapidfuzz.process import extractOne
+from rapidfuzz.utils import default_process
+from requests.adapters import HTTPAdapter
 from speech import tts
 from worker import WorkerThread
 
+try:
+    # Optional, faster JSON encoding and decoding.
+    from orjson import dumps as _json_dumps, loads as _json_loads
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj).encode()
+
+    _json_loads = json.loads
+
 logging.getLogger('urllib3.connectionpool').setLevel(logging.INFO)
 
 
 _ECO = 'Encyclopedia of Chess Openings'
 
-_valid_puzzle_themes = { k for k in puzzle_themes if PuzzleCollection().filter(k) }
+_puzzles = PuzzleCollection()
+_valid_puzzle_themes = frozenset(k for k in puzzle_themes if k in _puzzles.by_theme)
+
+def _theme_key(theme):
+    ''' Normalize theme for matching: lowercase, no whitespace or punctuation. '''
+    return default_process(theme).replace(' ', '')
+
+# Valid themes, and their normalized forms for matching (same order).
+_theme_list = tuple(sorted(_valid_puzzle_themes))
+_theme_keys = tuple(_theme_key(t) for t in _theme_list)
+_theme_by_key = dict(zip(_theme_keys, _theme_list))
+
 
 ''' Function names. '''
 _analyze_position = 'analyze_position'
@@ -68,6 +93,7 @@ _content = 'content'
 _center_control = 'center_control'
 _description = 'description'
 _eco = 'eco'
+_enum = 'enum'
 _error = 'error'
 _fen = 'FEN'
 _function = 'function'
@@ -97,10 +123,17 @@ _turn = 'turn'
 _user = 'user'
 _validate = 'validate'
 
+''' Intern the keywords compared in the hot paths, so that the messages
+constructed by this module can be compared by identity rather than equality.
+'''
+_assistant, _content, _function, _function_call, _role, _user = map(
+    sys.intern, (_assistant, _content, _function, _function_call, _role, _user)
+)
+
 ''' Functions.
 https://platform.openai.com/docs/guides/function-calling
 '''
-_FUNCTIONS = [
+_FUNCTIONS = (
     {
         _name: _analyze_position,
         _description: (
@@ -137,15 +170,14 @@ _FUNCTIONS = [
     },
     {
         _name: _load_puzzle,
-        _description: (
-            'Load a chess puzzle that matches the specified theme. '
-        ) + 'The valid themes are: ' + ', '.join(_valid_puzzle_themes),
+        _description: 'Load a chess puzzle that matches the specified theme.',
         _parameters: {
             _type: _object,
             _properties : {
                 _theme: {
                     _type: _string,
-                    _description: 'puzzle theme'
+                    _description: 'puzzle theme',
+                    _enum: _theme_list,
                 },
             }
         }
@@ -214,7 +246,11 @@ _FUNCTIONS = [
             _required: [_move]
         }
     }
-]
+)
+
+# The schema is static; serialize it once, to be spliced into the requests.
+_FUNCTIONS_JSON = _json_dumps(_FUNCTIONS)
+_FUNCTIONS_SIZE = len(json.dumps(_FUNCTIONS))  # For the token count estimate, see get_token_count.
 
 # Limit responses to English, because the app has hardcoded stuff (for now).
 
@@ -237,6 +273,28 @@ _SYSTEM_PROMPT = (
     f"a move. "
 ) + _BASIC_PROMPT
 
+''' System messages, built once. '''
+_BASIC_MSG = {_role: _system, _content: _BASIC_PROMPT}
+_SYSTEM_MSG = {_role: _system, _content: _SYSTEM_PROMPT}
+
+
+@lru_cache(maxsize=64)
+def _puzzle_system_message(system_prompt, puzzle_theme):
+    ''' Return the system message for puzzle mode, cached by prompt and theme. '''
+    content = system_prompt + (
+        f'Summarize the active puzzle without providing any move hints. '
+        f'When the user asks for the solution to the problem, reply with '
+        f'a grandmaster quote, or a koan. The puzzle theme is: {puzzle_theme}. '
+    )
+    return {_role: _system, _content: content}
+
+
+''' Replies for failed requests, indexed by can_use_remote(). '''
+_FAILED_REQUEST_MSGS = (
+    'I did not understand your request.',
+    'I cannot complete your request at this time.'
+)
+
 
 class AppLogic(Enum):
     NONE = 0
@@ -246,36 +304,44 @@ class AppLogic(Enum):
     CANCELLED = 4
 
 
-FunctionResult = namedtuple('FunctionResult', 'response data', defaults=(AppLogic.NONE, None))
+class FunctionResult:
+    __slots__ = ('response', 'data')
+
+    def __init__(self, response=AppLogic.NONE, data=None):
+        self.response = response
+        self.data = data
+
+    def __repr__(self):
+        return f'FunctionResult(response={self.response}, data={self.data!r})'
 
 
 def parse_json(text):
     try:
-        return json.loads(text)
+        return _json_loads(text)
 
     except Exception as e:
         Logger.error(f'{_assistant}: {e} {text}')
 
 
 class FunctionCall:
-    dispatch = {}
-
     def __init__(self, name, arguments):
         self.name = name
         self.arguments = parse_json(arguments)
 
-    def execute(self, user_request):
+    def execute(self, dispatch, user_request):
         Logger.info(f'{_assistant}: FunctionCall={self.name}({self.arguments})')
-        if self.name in FunctionCall.dispatch:
-            return FunctionCall.dispatch[self.name](user_request, self.arguments)
+        if func := dispatch.get(self.name):
+            return func(user_request, self.arguments)
 
-    @staticmethod
-    def register(name, func):
-        FunctionCall.dispatch[name] = func
+
+''' Color names, indexed by chess.Color '''
+_color_names = tuple(chess.COLOR_NAMES)
+_color_titles = tuple(c.capitalize() for c in chess.COLOR_NAMES)
+_to_move = tuple(f'{c} to move' for c in _color_titles)
 
 
 def _get_user_color(app):
-    return chess.COLOR_NAMES[app.engine.opponent]
+    return _color_names[app.engine.opponent]
 
 
 _colors = {'black': False, 'white': True}
@@ -286,22 +352,26 @@ def _get_color(name):
         return _colors.get(name.lower())
 
 
+def _get_pgn(app):
+    return app.transcribe(columns=None, engine=False)[1]
+
+
 class GameState:
     def __init__(self, app=None):
         self.valid = False
         if app:
             #self.epd = app.engine.board.epd()
             self.center = CenterControl(app.engine.board)
-            self.pgn = app.transcribe(columns=None, engine=False)[1]
+            self.pgn = _get_pgn(app)
             self.turn = None if app.engine.is_game_over() else app.engine.board.turn
-            self.user_color = _get_user_color(app)
+            self.user_color = app.engine.opponent
             self.valid = True
 
     def to_dict(self):
         turn = None
         if self.turn is not None:
             # Format the turn to make it as clear as possible to the AI:
-            turn = f'{chess.COLOR_NAMES[self.turn].capitalize()} to move'
+            turn = _to_move[self.turn]
 
         return {
             # Do not send the FEN, it looks like ChatGPT cannot parse it
@@ -310,7 +380,7 @@ class GameState:
             _center_control: self.center.status,
             _pgn: self.pgn,
             _turn: turn,
-            _user: self.user_color.capitalize(),
+            _user: _color_titles[self.user_color],
         }
 
     def __str__(self):
@@ -320,10 +390,12 @@ class GameState:
 class Context:
     ''' Keeps track of the conversation history '''
 
+    __slots__ = ('history', 'user', 'position')
+
     def __init__(self):
         self.history = []
         self.user = None  # The side the user is playing
-        self.epd = None
+        self.position = None  # Transposition key of the last position seen
 
 
     def add_message(self, message):
@@ -360,29 +432,30 @@ class Context:
         Returns:
             dict: The input message unchanged, or the modified message.
         '''
-        if message[_role] == _user:
+        if message[_role] is _user:
             user_color = _get_user_color(app)
-            epd = app.engine.board.epd()
+            # Compare bitboards rather than building and comparing EPD strings.
+            position = app.engine.board._transposition_key()
             changes = []
 
             if not app.engine.is_game_over():
                 if self.user != user_color:
                     changes.append(f'I am playing as {user_color}.')
 
-                if self.epd and self.epd != epd:
+                if self.position and self.position != position:
                     if not app.puzzle:
-                        changes.append(f'The position has changed: {GameState(app).pgn}.')
+                        changes.append(f'The position has changed: {_get_pgn(app)}.')
 
             if changes:
                 if not app.engine.is_game_over():
-                    turn = chess.COLOR_NAMES[app.engine.board.turn]
+                    turn = _color_names[app.engine.board.turn]
                     changes.append(f'It is {turn}\'s turn to move.')
                 changes = ' '.join(changes)
                 #content = f'{changes} {message[_content]}'
                 content = f'{message[_content]} (Context: {changes})'
                 message = {_role: _user, _content: content}
 
-            self.epd = epd  # Keep track of the board state.
+            self.position = position  # Keep track of the board state.
             self.user = user_color  # Keep track of the side played by the user.
 
         return message
@@ -403,33 +476,40 @@ class Context:
         '''
         current_msg = self.annotate_user_message(app, current_msg)
 
-        if current_msg[_role] == _function:
-            system_prompt = _BASIC_PROMPT  # Save some tokens
+        if current_msg[_role] is _function:
+            system_msg = _BASIC_MSG  # Save some tokens
         else:
-            system_prompt = _SYSTEM_PROMPT
+            system_msg = _SYSTEM_MSG
 
         if app.puzzle:
-            system_prompt += (
-                f'Summarize the active puzzle without providing any move hints. '
-                f'When the user asks for the solution to the problem, reply with '
-                f'a grandmaster quote, or a koan. The puzzle theme is: {puzzle_description(app.puzzle)}. '
-            )
-
-        while True:
-            # Prefix messages with the system prompt.
-            msgs = [{_role: 'system', _content: system_prompt}] + self.history + [current_msg]
+            system_msg = _puzzle_system_message(system_msg[_content], puzzle_description(app.puzzle))
 
-            token_count = get_token_count(model, msgs, functions)
+        # Prefix messages with the system prompt.
+        msgs = [system_msg] + self.history + [current_msg]
 
-            if token_count <= token_limit:
-                Logger.debug(f'{_assistant}: token_count={token_count}')
-                break
+        # Same estimate as get_token_count, but measure each message only once, then
+        # subtract the sizes of the oldest messages (json.dumps joins items with ', ').
+        sizes = [len(json.dumps(m)) for m in msgs]
+        if functions:
+            size = _FUNCTIONS_SIZE if functions is _FUNCTIONS else len(json.dumps(functions))
+        else:
+            size = 0
+        size += sum(sizes) + 2 * len(sizes)
+        count = 0  # Number of old messages to remove.
 
-            if not self.history:
+        while (token_count := int(size / 4)) > token_limit:
+            if count == len(self.history):
                 # There are no more old messages to remove!
                 raise RuntimeError(f'Request size (~{token_count} tokens) exceeds token limit ({token_limit}).')
 
-            self.history.pop(0)  # Remove the oldest message.
+            count += 1
+            size -= sizes[count] + 2
+
+        Logger.debug(f'{_assistant}: token_count={token_count}')
+
+        if count:
+            del self.history[:count]  # Remove the oldest messages.
+            del msgs[1:count + 1]
 
         return msgs
 
@@ -440,23 +520,46 @@ class Context:
         the size of the context under control (the game state info sent back from
         functions can get large fast, and the most recent state is what matters anyway).
         '''
-        indices = [i for i in range(len(self.history))]
-        # Logger.debug(f'{_assistant}: history=\n{json.dumps(self.history, indent=2)}')
-        for i, entry in enumerate(self.history[:-2]):
-            if self.history[i][_role] == _function:
-                indices.remove(i)
-                if i > 0 and _function_call in self.history[i-1]:
-                    indices.remove(i-1)
-        self.history = [self.history[i] for i in indices]
+        history = self.history
+        removed = set()
+        # Logger.debug(f'{_assistant}: history=\n{json.dumps(history, indent=2)}')
+        for i in range(len(history) - 2):
+            if history[i][_role] is _function:
+                removed.add(i)
+                if i > 0 and _function_call in history[i-1]:
+                    removed.add(i-1)
+        self.history = [m for i, m in enumerate(history) if i not in removed]
         # Logger.debug(f'{_assistant}: history=\n{json.dumps(self.history, indent=2)}')
 
 
-def remove_func(funcs, function):
-    ''' Remove function from the schema. '''
-    funcs = {f[_name]:f for f in funcs if f[_name] != function}  # convert to dictionary
-    assert function not in funcs  # verify that it is removed
+def _match_puzzle_theme(theme):
+    '''
+    Map a misspelled theme (e.g. "mate in 3" or "smotherd mate") to a valid one
+    locally, rather than paying for another round-trip to the model.
+    '''
+    if not isinstance(theme, str) or theme in _valid_puzzle_themes:
+        return theme
+
+    key = _theme_key(theme)
+    if theme_match := _theme_by_key.get(key):
+        return theme_match
+
+    # Plain ratio: WRatio's partial matching maps e.g. "endgame" to "bishopEndgame".
+    match = extractOne(key, _theme_keys, scorer=ratio, score_cutoff=80)
 
-    return list(funcs.values())  # convert back to list
+    # Numbers must agree: "mateIn2" is close to "mateIn3", but is a different theme.
+    if match and re.sub(r'\D', '', match[0]) == re.sub(r'\D', '', key):
+        theme_match = _theme_list[match[2]]
+        Logger.info(f'{_assistant}: theme "{theme}" matched "{theme_match}"')
+        return theme_match
+
+    return theme
+
+
+def _pick_puzzle(theme):
+    ''' Choose a puzzle at random from the subset that matches the theme. '''
+    if isinstance(theme, str) and theme in _valid_puzzle_themes:
+        return random.choice(_puzzles.filter(theme))
 
 
 class Assistant:
@@ -466,6 +569,7 @@ class Assistant:
         self._cancelled = False
         self._ctxt = Context()
         self._handlers = {}
+        self._functions = {}  # Dispatch table for function calls, by name.
         self._register_funcs()
         self._register_handlers()
         self.endpoint = 'https://api.openai.com/v1/chat/completions'
@@ -481,9 +585,32 @@ class Assistant:
         self.temperature = 0.01
         self._worker = WorkerThread()
         self.last_call = None
-        self.session = requests.Session()
+        self.session = self._create_session()
+        self._response = None  # The response currently being read, if any.
         self.intent_recognizer = IntentClassifier()
-        self.intent_recognizer.load('intent-model')
+
+        # Load the model on the worker thread, off the app startup path. The worker
+        # runs its tasks in order, so the model is loaded before the first call.
+        self._worker.send_message(self._load_intent_model)
+
+
+    def _load_intent_model(self):
+        try:
+            self.intent_recognizer.load('intent-model')
+        except:
+            Logger.exception(f'{_assistant}: Error loading intent model.')
+
+
+    @staticmethod
+    def _create_session():
+        '''
+        Create the HTTP session used for all requests to the endpoint. The requests are
+        sequential, so a single pooled connection is kept alive and reused between calls.
+        '''
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        session.headers['Content-Type'] = 'application/json'
+        return session
 
 
     @property
@@ -496,8 +623,16 @@ class Assistant:
             self._app.stop_spinner()
             self._busy = False
             self._cancelled = True
-            self.session.close()
-            self.session = requests.Session()
+            # Abort the request in flight, but keep the session's connection
+            # pool, so that the next request does not pay for a new handshake.
+            if response := self._response:
+                response.close()
+
+
+    def close(self):
+        ''' Cancel any request in flight and release the pooled connections. '''
+        self.cancel()
+        self.session.close()
 
 
     def can_use_local(self):
@@ -536,37 +671,44 @@ class Assistant:
 
         response = None
         headers = {
-            'Content-Type': 'application/json',
             'Authorization': 'Bearer ' + self._app.get_openai_key(obfuscate=False),
         }
-        json_data = {
+        body = _json_dumps({
             'model': self.model,
             'messages': messages,
             'temperature': self.temperature,
-        }
+            'stream': True,
+        })
         if functions:
-            json_data['functions'] = functions
+            functions = _FUNCTIONS_JSON if functions is _FUNCTIONS else _json_dumps(functions)
+            body = body[:-1] + b', "functions": ' + functions + b'}'
 
         try:
             Logger.info(f'{_assistant}: posting request to {self.endpoint}')
 
-            response = self.session.post(
+            with self.session.post(
                 self.endpoint,
                 headers=headers,
-                json=json_data,
+                data=body,
                 timeout=timeout,
-            )
+                stream=True,
+            ) as response:
+                self._response = response
+                if response:
+                    content = self._read_stream(response)
+                else:
+                    content = self._read_content(response)  # Errors are not streamed.
+
             if self._cancelled:
                 Logger.info(f'{_assistant}: response cancelled')
                 return None, FunctionResult(AppLogic.CANCELLED)
 
             if response:
                 self._ctxt.add_message(messages[-1])  # outgoing message posted successfully
-                content = parse_json(response.content)
                 return self._on_api_response(user_request, content)
 
             else:
-                content = parse_json(response.content)
+                content = parse_json(content)
                 Logger.error(f'{_assistant}: {content}')
                 try:
                     self.respond_to_user(content['error']['message'])
@@ -578,12 +720,66 @@ class Assistant:
             return None, FunctionResult(AppLogic.RETRY)
 
         except:
+            if self._cancelled:
+                Logger.info(f'{_assistant}: request cancelled')
+                return None, FunctionResult(AppLogic.CANCELLED)
+
             Logger.exception('Assistant: Error generating API response.')
             return None, FunctionResult(AppLogic.RETRY)
 
+        finally:
+            self._response = None
+
         return None, FunctionResult()
 
 
+    def _read_content(self, response):
+        '''
+        Read the body of a streamed response in chunks, so that cancel() takes effect
+        without waiting for the entire content. Return None if cancelled.
+        '''
+        chunks = []
+        for chunk in response.iter_content(chunk_size=4096):
+            if self._cancelled:
+                return None
+            chunks.append(chunk)
+
+        return b''.join(chunks)
+
+
+    def _read_stream(self, response):
+        '''
+        Accumulate the server-sent events of a streamed completion into a response
+        shaped like a non-streamed one. Return None if cancelled.
+        '''
+        content, name, arguments = [], [], []
+        reason = None
+
+        for line in response.iter_lines():
+            if self._cancelled:
+                return None
+            if not line.startswith(b'data: '):
+                continue  # Skip the blank lines separating events.
+            data = line[6:]
+            if data == b'[DONE]':
+                continue  # Read to the end, so the connection is returned to the pool.
+            choice = _json_loads(data)['choices'][0]
+            delta = choice.get('delta', {})
+            if text := delta.get(_content):
+                content.append(text)
+            if call := delta.get(_function_call):
+                name.append(call.get(_name) or '')
+                arguments.append(call.get(_arguments) or '')
+            reason = choice.get('finish_reason') or reason
+
+        message = {_role: _assistant, _content: ''.join(content)}
+        if name:
+            message[_content] = message[_content] or None
+            message[_function_call] = {_name: ''.join(name), _arguments: ''.join(arguments)}
+
+        return {'choices': [{'message': message, 'finish_reason': reason}]}
+
+
     def _on_api_response(self, user_request, response):
         '''
         Handle response from the OpenAI API, dispatch function calls as needed.
@@ -605,7 +801,7 @@ class Assistant:
                 self._ctxt.add_function_call(function_call)
 
                 try:
-                    result = function_call.execute(user_request)
+                    result = function_call.execute(self._functions, user_request)
                 except Exception as e:
                     result = None
                     Logger.error(f'{function_call.name}: exception: {e}')
@@ -726,11 +922,7 @@ class Assistant:
             task_completed()
 
             if status is None:
-                messages = [
-                    'I did not understand your request.',
-                    'I cannot complete your request at this time.'
-                ]
-                msg = messages[self.can_use_remote()]
+                msg = _FAILED_REQUEST_MSGS[self.can_use_remote()]
                 if self._app.uses_assistant():
                     self.respond_to_user('Sorry, ' + msg)
                 else:
@@ -772,7 +964,7 @@ class Assistant:
             current_message = {
                _role: _function,
                _name: callback_result.pop(_function),
-               _content: str(callback_result)
+               _content: json.dumps(callback_result, separators=(',', ':'), default=str)
             }
             # Do not use functions when returning the result of a function call
             funcs = None
@@ -786,16 +978,20 @@ class Assistant:
 
         token_limit = int(get_token_limit(self.model) * 0.85)
 
+        messages = None  # Built on the first iteration, and rebuilt only when stale.
+        disabled = set()  # Names of functions called with invalid arguments.
+
         for retry_count in range(self.retry_count):
-            messages = self._ctxt.messages(
-                current_message,
-                app=self._app,
-                model=self.model,
-                functions=funcs,  # for get_token_count
-                token_limit=token_limit
-            )
-            # Dump pretty-printed messages to log.
-            Logger.debug(f'{_assistant}: messages=\n{json.dumps(messages, indent=2)}')
+            if messages is None:
+                messages = self._ctxt.messages(
+                    current_message,
+                    app=self._app,
+                    model=self.model,
+                    functions=funcs,  # for the token count
+                    token_limit=token_limit
+                )
+                # Dump pretty-printed messages to log.
+                Logger.debug(f'{_assistant}: messages=\n{json.dumps(messages, indent=2)}')
 
             # Post the request and dispatch the response.
             func_name, func_result = self._completion_request(
@@ -806,17 +1002,20 @@ class Assistant:
 
             # Handle the case of functions being called with invalid args.
             if func_result.response == AppLogic.INVALID:
+                messages = None  # The conversation history has changed.
                 if retry_count == 0:
                     current_message = {
                         _role: _function,
                         _name: func_name,
                         _content: f'{_error}: invalid parameters',
                     }
-                else:
-                    funcs = remove_func(funcs, func_name)
+                elif funcs and func_name not in disabled:
+                    disabled.add(func_name)
+                    funcs = tuple(f for f in _FUNCTIONS if f[_name] not in disabled)
 
             elif func_result.response == AppLogic.RETRY:
                 if func_result.data:
+                    messages = None
                     content = f'{_retry}: use different arguments. {func_result.data}'
                     if func_name:
                         current_message = {
@@ -827,7 +1026,7 @@ class Assistant:
                     else:
                         current_message = {_role: _user, _content: content}
                 else:
-                    timeout *= 1.5  # Handle network timeouts.
+                    timeout *= 1.5  # Handle network timeouts, resend the same messages.
 
             else:
                 return True  # Success
@@ -904,7 +1103,7 @@ class Assistant:
         formatted_result[_function] = function
 
         if result is not None:
-            formatted_result[_result] = str(result)
+            formatted_result[_result] = result  # Serialized as JSON, along with the state.
 
         return formatted_result
 
@@ -924,24 +1123,26 @@ class Assistant:
         Returns:
             FunctionResult:
         '''
+        app = self._app
+
         # Handle the "game over" edge case.
-        if self._app.engine.is_game_over():
+        if app.engine.is_game_over():
             return self._complete_on_same_thread(user_request, _analyze_position)
 
         # Do not provide analysis in puzzle mode. Let the user figure it out.
-        if self._app.puzzle:
+        if app.puzzle:
             return self._complete_on_same_thread(
                 user_request, _analyze_position, 'User should solve puzzles unassisted.'
             )
 
         # Do not provide analysis on the engine's turn
-        if self._app.engine.is_own_turn():
+        if app.engine.is_own_turn():
             return self._complete_on_same_thread(
                 user_request, _analyze_position, 'It is not the user\'s turn.'
             )
 
         # Start analysing asynchronously; will call back when finished.
-        self._app.analyze(assist=(user_request, _analyze_position))
+        app.analyze(assist=(user_request, _analyze_position))
 
         return FunctionResult(AppLogic.OK)
 
@@ -959,9 +1160,12 @@ class Assistant:
         if not requested_openings:
             return FunctionResult(AppLogic.INVALID)
 
+        # The model sometimes repeats names in the list; look up each name only once.
+        requested_openings = list(dict.fromkeys(requested_openings))
+
         max_results = max(inputs.get(_limit, 1), len(requested_openings))
         search_limit = int(math.ceil(max_results / len(requested_openings)))
-        results = []
+        results = {}  # Matching openings by name; different queries may find the same ones.
 
         def filter_fields(opening, name_only):
             assert isinstance(opening, Opening), opening
@@ -971,7 +1175,13 @@ class Assistant:
                 result[_pgn] = opening.pgn
             return result
 
+        # Without the remote assistant only the first match gets played.
+        use_remote = self.can_use_remote()
+
         for name in requested_openings:
+            if results and not use_remote:
+                break
+
             args = {
                 _name: name,
                 _eco: inputs.get(name, None)
@@ -980,13 +1190,17 @@ class Assistant:
 
             if not search_results:
                 Logger.warning(f'{_assistant}: Not found: {str(inputs)}')
-            elif isinstance(search_results, list):
-                results += search_results
-            else:
-                assert isinstance(search_results, Opening)
-                results.append(search_results)
+                continue
+
+            if not isinstance(search_results, list):
+                search_results = (search_results,)
+
+            for opening in search_results:
+                results.setdefault(opening.name, opening)
 
-        if self.can_use_remote():
+        results = list(results.values())
+
+        if use_remote:
             results = {
                 _result: 'ok' if results else 'no match',
                 _return: [filter_fields(r, len(results) > 1) for r in results]
@@ -1044,16 +1258,10 @@ class Assistant:
         Handle the request to select a puzzle by given theme.
         Filter all puzzles by theme and select one at random.
         '''
-        theme = inputs.get(_theme)
-        if not theme:
-            return FunctionResult(AppLogic.INVALID)
-
-        puzzles = PuzzleCollection().filter(theme)
-        if not puzzles:
-            return FunctionResult(AppLogic.INVALID)  # invalid theme
-
-        # Choose puzzle at random from the subset that matches the theme.
-        selection = random.choice(puzzles)
+        theme = _match_puzzle_theme(inputs.get(_theme))
+        selection = _pick_puzzle(theme)
+        if not selection:
+            return FunctionResult(AppLogic.INVALID)  # missing or invalid theme
 
         def play_puzzle(puzzle):
             ''' Called after the user confirms the puzzle. '''
@@ -1096,6 +1304,7 @@ class Assistant:
         color = _get_color(inputs.get(_user))
 
         opening = None
+        moves_only = None
 
         game = chess.pgn.read_game(StringIO(pgn))  # Parse the PGN for validation.
         if game:
@@ -1106,6 +1315,14 @@ class Assistant:
 
             pgn = game.accept(exporter).rstrip(' *')
 
+            # Build the game equivalent to the stripped PGN from the parsed moves,
+            # so that play_pgn does not need to parse it again. The stripped PGN
+            # has no FEN header, so this only applies to the standard start position.
+            if not game.headers.get('FEN'):
+                moves_only = chess.pgn.Game()
+                moves_only.headers['Result'] = game.headers.get('Result', '*')
+                moves_only.add_line(game.mainline_moves())
+
         else:
             pgn = None  # invalid
 
@@ -1117,7 +1334,9 @@ class Assistant:
         on_done = partial(self.complete_on_main_thread, user_request, _make_moves, resume=True)
 
         def make_moves():
-            status = self._app.play_pgn(pgn, animate=animate, callback=on_done, color=color, name=opening)
+            status = self._app.play_pgn(
+                pgn, game=moves_only, animate=animate, callback=on_done, color=color, name=opening
+            )
             if not status:
                 retry_message = f'There was an error making the moves, run {_analyze_position}.'
                 # At this point we're in a asynchronous callback, can't use AppLogic.RETRY
@@ -1145,13 +1364,7 @@ class Assistant:
 
         self._app.speak_move_description(move)
 
-        def make_move(*_):
-            if tts.is_speaking():
-                Clock.schedule_once(make_move, 0.25)
-            else:
-                self._app.engine.input(move)
-
-        make_move()
+        tts.on_finished(partial(self._app.engine.input, move))
         return FunctionResult(AppLogic.OK)
 
 
@@ -1167,12 +1380,12 @@ class Assistant:
 
 
     def _register_funcs(self):
-        FunctionCall.register(_analyze_position, self._handle_analysis)
-        FunctionCall.register(_lookup_openings, self._handle_lookup_openings)
-        FunctionCall.register(_make_moves, self._handle_make_moves)
-        FunctionCall.register(_make_one_move, self._handle_make_one_move)
-        FunctionCall.register(_play_opening, self._handle_play_opening)
-        FunctionCall.register(_load_puzzle, self._handle_puzzle_request)
+        self._functions[_analyze_position] = self._handle_analysis
+        self._functions[_lookup_openings] = self._handle_lookup_openings
+        self._functions[_make_moves] = self._handle_make_moves
+        self._functions[_make_one_move] = self._handle_make_one_move
+        self._functions[_play_opening] = self._handle_play_opening
+        self._functions[_load_puzzle] = self._handle_puzzle_request
 
 
     # -------------------------------------------------------------------
@@ -1250,30 +1463,46 @@ class Assistant:
         Args:
             text (str): The message to be presented to the user.
         '''
-        # Remove single SANs, so that the subsequent transformation does not double up the move.
-        response = remove_san_notation(response)
+        if not response:
+            return
 
-        # Convert list of moves (in short algebraic notation - SAN) to pronounceable text.
-        tts_text = substitute_chess_moves(response, ';')
-        tts_text = capitalize_chess_coords(tts_text)
+        tts_text = response
 
-        # Reformat numbered lists if the response does not seem to contain moves.
-        if tts_text == response:
-            pattern = r'(\d+\.[^\n;]+?)(?:\s|\n|\.)+(?=\s*\d+\.|\s*$)'
-            tts_text = re.sub(pattern, r'\1; ', response)
+        # Moves, square coordinates and numbered lists all contain digits, except for
+        # castling; skip the transformations below for plain text responses.
+        if 'O-O' in response or _digit_re.search(response):
 
-        else:
-            # Remove paranthesis enclosing move sequences to prevent reading aloud "smiley face".
-            tts_text = re.sub(r'\((.*?)\)', r'\1', tts_text)
+            # Remove single SANs, so that the subsequent transformation does not double up the move.
+            response = remove_san_notation(response)
+
+            # Convert list of moves (in short algebraic notation - SAN) to pronounceable text.
+            tts_text = substitute_chess_moves(response, ';')
+            tts_text = capitalize_chess_coords(tts_text)
+
+            # Reformat numbered lists if the response does not seem to contain moves.
+            if tts_text == response:
+                tts_text = _numbered_list_re.sub(r'\1; ', response)
+
+            else:
+                # Remove paranthesis enclosing move sequences to prevent reading aloud "smiley face".
+                tts_text = _parenthesized_re.sub(r'\1', tts_text)
 
         # Remove newlines from the on-screen text, to better fit inside the bubble.
         text = response.replace('\n', ' ')
 
-        # Schedule the bubble to pop up as soon as other modal boxes go away.
-        self._schedule_action(lambda *_: self._app.text_bubble(text))
+        def present(*_):
+            # Pop up the bubble as soon as other modal boxes go away.
+            self._run_action(lambda: self._app.text_bubble(text))
+
+            # Speak the tts_text curated text.
+            self._speak_response(tts_text)
 
-        # Speak the tts_text curated text.
-        self._speak_response(tts_text)
+        # Dispatch both from a single callback on the main thread.
+        voice_input = self._app.voice_input
+        if voice_input.is_running():
+            voice_input.stop()
+
+        Clock.schedule_once(present)
 
 
     def _search_opening(self, query, max_results=1):
@@ -1286,7 +1515,8 @@ class Assistant:
             Opening or list: best match or list of matches.
         '''
         eco = query.get(_eco)
-        name = query[_name]
+        # Normalize whitespace, for better hit rates in the ECO query caches.
+        name = ' '.join(query[_name].split())
 
         if eco:
             results = self._app.eco.query_by_eco_code(eco, name=name, top_n=max_results)
@@ -1306,27 +1536,42 @@ class Assistant:
         if self._app.voice_input.is_running():
             self._app.voice_input.stop()
 
+        Clock.schedule_once(partial(self._run_action, action))
+
+
+    def _run_action(self, action, *_):
+        '''
+        Run the action on the main thread if there are no modal popups; otherwise wait
+        for the topmost popup to be removed from the window (rather than polling), then
+        check again.
+
+        Note: on_dismiss fires before the popup's closing animation removes it from the
+        window, so the removal is detected by observing its parent property instead.
+        '''
         if self._app.has_modal_views():
-            Clock.schedule_once(partial(self._schedule_action, action), 0.1)
+            modal = Window.children[0]
+
+            def on_removed(*_):
+                modal.unbind(parent=on_removed)
+                Clock.schedule_once(partial(self._run_action, action))
+
+            modal.bind(parent=on_removed)
+
         else:
-            Clock.schedule_once(lambda *_: action(), 0.1)
+            action()
 
 
     def _speak_response(self, text):
+        ''' Speak the text when finished speaking any previous utterance. Main thread only. '''
+        if not text or not self._app.use_voice:
+            return
 
-        def speak(*_):
-            ''' Wait until finished speaking, then speak the tts_text string. '''
-            if tts.is_speaking():
-                Clock.schedule_once(speak, 0.25)
-            else:
-                Clock.schedule_once(partial(self._app.speak, tts_text))
+        Logger.debug(f'{_assistant}: {text}')
 
         # Make sure St. George is pronounced Saint George, not Street George
-        tts_text = re.sub(r'\bSt\.\b|\bst\.\b', 'Saint', text, flags=re.IGNORECASE)
+        tts_text = _saint_re.sub('Saint', text)
 
-        if text and self._app.use_voice:
-            Logger.debug(f'{_assistant}: {text}')
-            speak()
+        tts.on_finished(partial(self._app.speak, tts_text))
 
 
 _epd_regex = (
@@ -1337,6 +1582,14 @@ _epd_regex = (
     r'(\s[^\s]+)*'  # Optional fields
 )
 
+_epd_re = re.compile(_epd_regex)
+
 def contains_epd(text):
-    return re.search(_epd_regex, text) is not None
+    return _epd_re.search(text) is not None
+
+
+_digit_re = re.compile(r'\d')
+_numbered_list_re = re.compile(r'(\d+\.[^\n;]+?)(?:\s|\n|\.)+(?=\s*\d+\.|\s*$)')
+_parenthesized_re = re.compile(r'\((.*?)\)')
+_saint_re = re.compile(r'\bSt\.\b|\bst\.\b', re.IGNORECASE)
 
@@ -19,6 +19,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from functools import partial
 
 import chess
+from kivy.clock import Clock
 from kivy.core.image import Image as CoreImage
 from kivy.core.window import Window
 from kivy.graphics import *
@@ -53,6 +54,8 @@ class BoardWidget(AtlasChessWidget):
         self._paste = lambda *_: None
         self._hint = lambda *_: None
         self.drag = None
+        self._drag_pos = None  # Most recent (touch position, square) while dragging
+        self._drag_scheduled = False
         self.enable_variation_hints = True
         self.check_indicator = True
         self.long_press_delay = 0.75
@@ -95,14 +98,25 @@ class BoardWidget(AtlasChessWidget):
                     self.move = square
 
             if self.drag:
-                board = self.model.copy()
-                if self.move:
-                    board.remove_piece_at(chess.parse_square(self.move))
-                self.redraw_pieces(None, board=board)
-                xy = [p - self.square_size/2 for p in touch.pos]
-                with self.canvas:
-                    Color(*self.clear_color)
-                    self.redraw_drag_piece(board, self.drag, chess.parse_square(square), xy, 2 * [self.square_size])
+                # Move events can come in faster than the frame rate, redraw once per frame.
+                self._drag_pos = touch.pos, square
+                if not self._drag_scheduled:
+                    self._drag_scheduled = True
+                    Clock.schedule_once(self._redraw_drag)
+
+
+    def _redraw_drag(self, *_):
+        self._drag_scheduled = False
+        if self.drag:
+            pos, square = self._drag_pos
+            board = self.model.copy()
+            if self.move:
+                board.remove_piece_at(chess.parse_square(self.move))
+            self._redraw_pieces(None, board=board)  # Private copy, no need to lock.
+            xy = [p - self.square_size/2 for p in pos]
+            with self.canvas:
+                Color(*self.clear_color)
+                self.redraw_drag_piece(board, self.drag, chess.parse_square(square), xy, 2 * [self.square_size])
 
 
     def on_touch_up(self, touch):
@@ -144,12 +158,8 @@ class BoardWidget(AtlasChessWidget):
 
 
     def redraw_pieces(self, move, board=None, overlay=False, scale=1):
-        if board:
-            with board._lock:
-                self._redraw_pieces(move, board, overlay, scale)
-        else:
-            with self.model._lock:
-                self._redraw_pieces(move, board, overlay, scale)
+        with (board or self.model)._lock:
+            self._redraw_pieces(move, board, overlay, scale)
 
 
     def _redraw_pieces(self, move, board=None, overlay=False, scale=1):
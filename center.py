@@ -19,28 +19,34 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import chess
 
 class Controller:
+    __slots__ = ('piece_type', 'square', 'controlled_mask', 'pinned', 'threatened', 'value')
+
     def __init__(self, piece_type, square):
         self.piece_type = piece_type
         self.square = square  # The square where the piece is located
-        self.controlled_squares = []  # Squares controlled by this piece
+        self.controlled_mask = 0  # Bitmask of squares controlled by this piece
         self.pinned = False  # Is the piece pinned?
         self.threatened = False  # Is the piece threatened?
         self.value = 0  # Numeric value of contribution to center control
 
+    @property
+    def controlled_squares(self):
+        return chess.scan_forward(self.controlled_mask)
+
     def add_controlled_square(self, square):
-        if square not in self.controlled_squares:
-            self.controlled_squares.append(square)
+        self.controlled_mask |= chess.BB_SQUARES[square]
 
     def update_contribution(self, value):
         self.value += value
 
-    def update_threatened(self, board, color):
+    def update_threatened(self, board, color, is_pinned=None, attackers_mask=None):
         if not self.threatened:
             attacked = False
-            attackers = board.attackers(not color, self.square)
+            is_pinned = is_pinned or board.is_pinned
+            attackers_mask = attackers_mask or board.attackers_mask
 
-            for attacking_square in attackers:
-                if board.is_pinned(not color, attacking_square):
+            for attacking_square in chess.scan_forward(attackers_mask(not color, self.square)):
+                if is_pinned(not color, attacking_square):
                     continue
 
                 if board.piece_type_at(attacking_square) < self.piece_type:
@@ -50,7 +56,7 @@ class Controller:
                 attacked = True
 
             # Piece is threatened with capture if not defended by pieces of own color.
-            self.threatened = attacked and not board.is_attacked_by(color, self.square)
+            self.threatened = attacked and not attackers_mask(color, self.square)
 
 
 class CenterControl:
@@ -65,40 +71,67 @@ class CenterControl:
 
     def __init__(self, board):
         self.controllers = [[], []]  # 0: black, 1: white
+        self._controller_index = [{}, {}]  # (piece_type, square) -> Controller, by color
         self.status = None  # Can be None, 'white', or 'black'
         self.score = {chess.WHITE: 0, chess.BLACK: 0}
         self.populate_controllers(board)
 
     def populate_controllers(self, board):
-        for color in [chess.WHITE, chess.BLACK]:
-            if color == board.turn and board.is_check():
-                self.score[color] += self.CHECK_PENALTY
+        turn = board.turn
+        if board.is_check():
+            self.score[turn] += self.CHECK_PENALTY
+
+        # Look up the center pieces once, not once per color. Use piece_type_at and
+        # color_at rather than piece_at, which allocates (and is locked in BoardModel).
+        center_pieces = [
+            (square, board.piece_type_at(square), board.color_at(square)) for square in self.center_squares
+        ]
+
+        pins = {}  # Memoized board.is_pinned results, by (color, square)
+
+        # Attackers of the center squares, by (color, square), computed once up front:
+        # they are also needed by update_threatened for pieces occupying the center.
+        attackers = {
+            (color, square): board.attackers_mask(color, square)
+            for color in chess.COLORS for square in self.center_squares
+        }
+
+        def attackers_mask(color, square):
+            if (key := (color, square)) not in attackers:
+                attackers[key] = board.attackers_mask(color, square)
+            return attackers[key]
+
+        def is_pinned(color, square):
+            if (key := (color, square)) not in pins:
+                pins[key] = board.is_pinned(color, square)
+            return pins[key]
 
-            for square in self.center_squares:
-                if piece := board.piece_at(square):
-                    if piece.piece_type == chess.KING:
+        for color in [chess.WHITE, chess.BLACK]:
+            for square, piece_type, piece_color in center_pieces:
+                if piece_type:
+                    if piece_type == chess.KING:
                         continue  # Exclude kings from analysis.
-                    if piece.color == color:
-                        controller = self.find_or_create_controller(piece.piece_type, square, color)
-                        controller.pinned = board.is_pinned(color, square)
-                        controller.update_threatened(board, color)
+                    if piece_color == color:
+                        controller = self.find_or_create_controller(piece_type, square, color)
                         controller.add_controlled_square(square)
                         controller.update_contribution(self.OCCUPANCY_SCORE)
 
-                attackers = board.attackers(color, square)
-                for attacker_square in attackers:
-                    attacker = board.piece_at(attacker_square)
-                    controller = self.find_or_create_controller(attacker.piece_type, attacker_square, color)
-                    controller.pinned = board.is_pinned(color, attacker_square)
-                    controller.update_threatened(board, color)
+                for attacker_square in chess.scan_forward(attackers[color, square]):
+                    attacker_type = board.piece_type_at(attacker_square)
+                    controller = self.find_or_create_controller(attacker_type, attacker_square, color)
                     controller.add_controlled_square(square)
                     controller.update_contribution(self.ATTACK_SCORE)
 
             for controller in self.controllers[color]:
+                # Pins and threats depend on the piece and its square only, evaluate them
+                # once per controller rather than once per center square it controls.
+                controller.pinned = is_pinned(color, controller.square)
+                controller.update_threatened(board, color, is_pinned, attackers_mask)
+
                 if controller.pinned:
                     controller.value *= self.PINNED_MULTIPLIER
                 if controller.threatened:
-                    controller.value *= self.THREATENDED_MULTIPLIER / (1 + (board.turn != color))
+                    controller.value *= self.THREATENDED_MULTIPLIER / (1 + (turn != color))
                 self.score[color] += controller.value
 
         # Set control status based on score
@@ -106,10 +139,11 @@ class CenterControl:
             self.status = chess.COLOR_NAMES[self.score[chess.WHITE] > self.score[chess.BLACK]]
 
     def find_or_create_controller(self, piece_type, square, color):
-        for c in self.controllers[color]:
-            if c.piece_type == piece_type and c.square == square:
-                return c
+        key = (piece_type, square)
+        if controller := self._controller_index[color].get(key):
+            return controller
 
         controller = Controller(piece_type, square)
         self.controllers[color].append(controller)
+        self._controller_index[color][key] = controller
         return controller
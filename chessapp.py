@@ -1195,6 +1195,10 @@ class ChessApp(App):
         return True
 
 
+    def on_stop(self):
+        self.assistant.close()
+
+
     def on_position_change(self, *_):
         self.save()
 
@@ -1989,12 +1993,13 @@ class ChessApp(App):
             return self.play_pgn(opening.pgn, name=opening.name, callback=callback, color=color)
 
 
-    def play_pgn(self, pgn, *, name=None, color=None, callback=None, animate=True):
+    def play_pgn(self, pgn, *, game=None, name=None, color=None, callback=None, animate=True):
         '''
         Parse the given PGN and apply moves to the board.
 
         Args:
             pgn (str): A game transcript in Portable Game Notation format.
+            game (chess.pgn.Game, optional): The already parsed pgn, if available. Defaults to None.
             name (str, optional): The name of the opening or short description. Defaults to None.
             color (bool, optional): The preferred point of view, Black or White. Defaults to None.
             callback (callable, optional): Completion notification (with no args). Defaults to None.
@@ -2028,7 +2033,7 @@ class ChessApp(App):
             else:
                 on_completion()
 
-        if game := chess.pgn.read_game(StringIO(pgn)):
+        if game := game or chess.pgn.read_game(StringIO(pgn)):
             current_pgn = self.get_current_play()
 
             if current_pgn and pgn.startswith(current_pgn):
@@ -86,8 +86,11 @@ class ECO:
 
     def __init__(self, index_dir=None):
         self.by_eco = defaultdict(list)
+        self.names_by_eco = defaultdict(list)  # Lowercase names, parallel to self.by_eco
         self.by_fen = {}
         self.data = []  # All openings
+        self.names = []  # Lowercase opening names, parallel to self.data
+        self.by_name = {}  # First opening by lowercase name, for exact matches
         for fname in self.tsv_files():
             self.read_tsv_file(fname)
         self.index = Index(index_dir) if index_dir else None
@@ -104,7 +107,11 @@ class ECO:
             for row in reader:
                 self.by_fen[row['epd']] = row
                 self.data.append(row)
+                name = row['name'].lower()
+                self.names.append(name)
+                self.by_name.setdefault(name, row)
                 self.by_eco[row['eco']].append(row)
+                self.names_by_eco[row['eco']].append(name)
 
     def lookup(self, board, transpose=False):
         ''' Lookup by board position (FEN). '''
@@ -137,6 +144,10 @@ class ECO:
     @lru_cache(maxsize=256)
     def query_by_name(self, query, *, max_distance=None, top_n=5):
         if self.index:
+            # Exact match, skip the fuzzy search (the common case for the best match only).
+            if top_n == 1 and (row := self.by_name.get(query.lower())):
+                return [Opening(row)]
+
             n = max(20, top_n * 5)  # Ask for a wider range than specified by the caller
             idx = self.index.search(query, max_distance=max_distance, top_n=n, min_nodes=len(self.data))
             #
@@ -144,7 +155,7 @@ class ECO:
             # NOTE: an IndexError below could be caused by:
             #   - the openings.idx was not rebuilt correctly after an ECO submodule update,
             #   - or the 'make clean; make' commands have not been executed in the ECO module.
-            results = {self.data[i]['name'].lower():i for i,_ in idx}
+            results = {self.names[i]:i for i,_ in idx}
 
             #print(f'\nQuery results for: {query}')
             #[print(k, i) for k,i in results.items()]
@@ -161,10 +172,15 @@ class ECO:
     @lru_cache(maxsize=256)
     def query_by_eco_code(self, code, *, name='', top_n=5):
         """ Lookup openings by ECO code or range of codes. """
+        name = name.lower()
         results = []
         for eco in self.get_codes(code):
-            # The only use case for looking up by code is to support the IntentClassifier,
-            # filter by name to avoid sending too much data out with the response.
-            results += [row for row in self.by_eco.get(eco, []) if name in row['name'].lower()]
+            if rows := self.by_eco.get(eco):
+                # The only use case for looking up by code is to support the IntentClassifier,
+                # filter by name to avoid sending too much data out with the response.
+                names = self.names_by_eco[eco]
+                results += [row for row, row_name in zip(rows, names) if name in row_name]
+                if len(results) >= top_n:
+                    break
 
         return [Opening(row) for row in results[:top_n]]
@@ -1,5 +1,7 @@
 import xml.etree.ElementTree as ET
 
+from collections import defaultdict
+
 # Based on:
 # https://github.com/lichess-org/lila/blob/master/translation/source/puzzleTheme.xml
 
@@ -80,6 +82,7 @@ def puzzle_description(puzzle):
 
 class PuzzleCollection:
     puzzle_list = []
+    by_theme = {}  # Index of puzzles by theme tag, built once by _parse.
 
     def __init__(self):
         self._puzzles = self.puzzle_list
@@ -109,8 +112,13 @@ class PuzzleCollection:
             i += 1
             PuzzleCollection.puzzle_list.append((id, fen, solutions, i, fields[-1]))
 
+        index = defaultdict(list)
         for p in PuzzleCollection.puzzle_list:
             assert puzzle_description(p)
+            for theme in p[-1].split():
+                index[theme].append(p)
+
+        PuzzleCollection.by_theme = {k: tuple(v) for k, v in index.items()}
 
     @property
     def count(self):
@@ -120,6 +128,9 @@ class PuzzleCollection:
         return self._puzzles[start : start + count]
 
     def filter(self, theme):
+        if puzzles := self.by_theme.get(theme):
+            return puzzles  # Exact theme tag, use the index.
+
         return [p for p in self._puzzles if theme in p[-1]]
 
 
@@ -34,6 +34,8 @@ Bypass plyer.tts because: it has no stop(); the Android impl is buggy.
 '''
 _scheduled = [None]
 _speaking = [False]
+_on_finished = []  # Callbacks waiting for the current utterance to finish.
+_lock = threading.Lock()
 
 
 def stop():
@@ -101,11 +103,25 @@ else:
 
     atexit.register(stop)
 
+    def _run_pending(*_):
+        '''
+        Run the callbacks waiting on speech to finish, in order. Stop when one of
+        them starts speaking; the others wait for that utterance to finish.
+        '''
+        while True:
+            with _lock:
+                if _speaking[0] or not _on_finished:
+                    return
+                callback = _on_finished.pop(0)
+
+            callback()
+
     def _subprocess(args, **kwargs):
         assert args
 
         _scheduled[0] = None
-        _speaking[0] = True
+        with _lock:
+            _speaking[0] = True
         p = subprocess.Popen(args, stdout=subprocess.DEVNULL, **kwargs)
 
         def background_wait(p):
@@ -115,7 +131,11 @@ else:
                 _, stderr = p.communicate()
                 output = stderr.decode().strip()
                 Logger.error(f"tts: {args[0]} returned {p.returncode} {output}")
-            _speaking[0] = False
+
+            with _lock:
+                _speaking[0] = False
+
+            Clock.schedule_once(_run_pending)
 
         thread = threading.Thread(target=background_wait, args=(p,))
         # exit abnormally if main thread is terminated
@@ -150,6 +170,29 @@ def is_speaking():
     return _speaking[0]
 
 
+def on_finished(callback):
+    '''
+    Call back when the utterance in progress is finished; if nothing is
+    being spoken, the callback is invoked immediately, on the caller's thread.
+    Otherwise it is invoked on the main thread, via the Kivy Clock.
+    '''
+    if platform == 'android':
+        # UtteranceProgressListener is an abstract class, which pyjnius
+        # cannot implement; fall back to polling the TextToSpeech instance.
+        if instance.isSpeaking():
+            Clock.schedule_once(lambda *_: on_finished(callback), 0.25)
+            return
+
+    else:
+        with _lock:
+            # Also queue behind callbacks that have not run yet, to keep the order.
+            if _speaking[0] or _on_finished:
+                _on_finished.append(callback)
+                return
+
+    callback()
+
+
 def speak(message, stt, *_):
     assert(message)
 
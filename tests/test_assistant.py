@@ -0,0 +1,157 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import assistant
+import json
+import unittest
+
+from gpt_utils import get_token_count
+from types import SimpleNamespace
+
+class FakeStreamResponse:
+    ''' Serve the lines of a server-sent events stream, like requests.Response.iter_lines. '''
+    def __init__(self, chunks):
+        self.lines = []
+        for chunk in chunks:
+            self.lines += [b'data: ' + json.dumps(chunk).encode(), b'']
+        self.lines += [b'data: [DONE]', b'']
+        self.consumed = False
+
+    def iter_lines(self):
+        yield from self.lines
+        self.consumed = True
+
+
+def _chunk(delta, finish_reason=None):
+    return {'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+
+
+class TestPuzzleThemes(unittest.TestCase):
+    def test_valid_theme(self):
+        for theme in assistant._valid_puzzle_themes:
+            self.assertEqual(assistant._match_puzzle_theme(theme), theme)
+
+    def test_misspelled_theme(self):
+        queries = {
+            "mate in 3": "mateIn3",
+            "Mate In 4": "mateIn4",
+            "back rank mate": "backRankMate",
+            "smotherd mate": "smotheredMate",
+            "x-ray attack": "xRayAttack",
+            "underpromotion": "underPromotion",
+        }
+        for query, expected in queries.items():
+            self.assertEqual(assistant._match_puzzle_theme(query), expected)
+
+    def test_invalid_theme(self):
+        # Real lichess themes, with no puzzles in the collection.
+        for theme in ["mateIn1", "mateIn2", "mateIn5", "mate in 2", "knightEndgame", "zugzwang"]:
+            self.assertNotIn(theme, assistant._valid_puzzle_themes)
+            self.assertEqual(assistant._match_puzzle_theme(theme), theme)
+
+    def test_not_a_string(self):
+        for theme in [None, ["fork"], {"theme": "fork"}]:
+            self.assertIs(assistant._match_puzzle_theme(theme), theme)
+            self.assertIsNone(assistant._pick_puzzle(theme))
+
+class TestContext(unittest.TestCase):
+    model = 'gpt-4o'
+
+    def setUp(self):
+        self.app = SimpleNamespace(puzzle=None)
+        self.history = []
+        for i in range(20):
+            self.history.append({'role': 'user', 'content': f'Question {i}: ' + 'x' * (i * 37 % 200)})
+            self.history.append({'role': 'assistant', 'content': f'Answer {i}: ' + 'y' * (i * 53 % 300)})
+        # Function results are not annotated with the position, and need no board.
+        self.current = {assistant._role: assistant._function, 'name': 'get_game_state', 'content': 'z' * 500}
+
+    def _context(self):
+        context = assistant.Context()
+        context.history = list(self.history)
+        return context
+
+    def _messages(self, context, token_limit):
+        return context.messages(
+            self.current,
+            app=self.app,
+            model=self.model,
+            functions=assistant._FUNCTIONS,
+            token_limit=token_limit
+        )
+
+    def test_trim(self):
+        system_msg = assistant._BASIC_MSG
+        full_count = get_token_count(self.model, [system_msg] + self.history + [self.current], assistant._FUNCTIONS)
+
+        for token_limit in range(full_count - 2000, full_count + 2, 37):
+            context = self._context()
+            try:
+                msgs = self._messages(context, token_limit)
+            except RuntimeError:
+                continue
+
+            # Remove the oldest messages one at a time, the straightforward way.
+            history = list(self.history)
+            while get_token_count(self.model, [system_msg] + history + [self.current], assistant._FUNCTIONS) > token_limit:
+                history.pop(0)
+
+            self.assertEqual(context.history, history)
+            self.assertEqual(msgs, [system_msg] + history + [self.current])
+            self.assertLessEqual(get_token_count(self.model, msgs, assistant._FUNCTIONS), token_limit)
+
+    def test_no_trim(self):
+        context = self._context()
+        msgs = self._messages(context, 1000000)
+        self.assertEqual(context.history, self.history)
+        self.assertEqual(len(msgs), len(self.history) + 2)
+
+    def test_exceeds_limit(self):
+        context = self._context()
+        with self.assertRaises(RuntimeError):
+            self._messages(context, 10)
+        self.assertEqual(context.history, self.history)
+
+class TestReadStream(unittest.TestCase):
+    def setUp(self):
+        self.assistant = assistant.Assistant.__new__(assistant.Assistant)
+        self.assistant._cancelled = False
+
+    def test_content(self):
+        response = FakeStreamResponse([
+            _chunk({'role': 'assistant', 'content': ''}),
+            _chunk({'content': 'Hello'}),
+            _chunk({'content': ', world!'}),
+            _chunk({}, 'stop'),
+        ])
+        content = self.assistant._read_stream(response)
+        self.assertTrue(response.consumed)
+        self.assertEqual(content, {'choices': [{
+            'message': {'role': 'assistant', 'content': 'Hello, world!'},
+            'finish_reason': 'stop'
+        }]})
+
+    def test_function_call(self):
+        response = FakeStreamResponse([
+            _chunk({'role': 'assistant', 'content': None, 'function_call': {'name': 'make_moves', 'arguments': ''}}),
+            _chunk({'function_call': {'arguments': '{"moves"'}}),
+            _chunk({'function_call': {'arguments': ': ["e4"]}'}}),
+            _chunk({}, 'function_call'),
+        ])
+        content = self.assistant._read_stream(response)
+        self.assertTrue(response.consumed)
+        self.assertEqual(content, {'choices': [{
+            'message': {
+                'role': 'assistant',
+                'content': None,
+                'function_call': {'name': 'make_moves', 'arguments': '{"moves": ["e4"]}'}
+            },
+            'finish_reason': 'function_call'
+        }]})
+
+    def test_cancelled(self):
+        self.assistant._cancelled = True
+        self.assertIsNone(self.assistant._read_stream(FakeStreamResponse([_chunk({'content': 'Hello'})])))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,21 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import puzzlelib
+import unittest
+
+class TestPuzzles(unittest.TestCase):
+    def setUp(self):
+        self.puzzles = puzzlelib.PuzzleCollection()
+
+    def test_filter(self):
+        # The theme index must agree with scanning the themes of all puzzles.
+        for theme in self.puzzles.by_theme:
+            expected = [p for p in self.puzzles.puzzle_list if theme in p[-1]]
+            self.assertEqual(list(self.puzzles.filter(theme)), expected)
+
+    def test_filter_not_indexed(self):
+        self.assertEqual(self.puzzles.filter('noSuchTheme'), [])
+
+if __name__ == '__main__':
+    unittest.main()
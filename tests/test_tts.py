@@ -0,0 +1,40 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from speech import tts
+import unittest
+
+@unittest.skipIf(tts.platform in ('android', 'ios'), 'speech runs in a subprocess on desktop only')
+class TestOnFinished(unittest.TestCase):
+    def tearDown(self):
+        tts._speaking[0] = False
+        tts._on_finished.clear()
+
+    def test_not_speaking(self):
+        calls = []
+        tts.on_finished(lambda: calls.append(1))
+        self.assertEqual(calls, [1])
+
+    def test_one_at_a_time(self):
+        calls = []
+
+        def speak(n):
+            calls.append(n)
+            tts._speaking[0] = True  # Start the next utterance.
+
+        tts._speaking[0] = True
+        tts.on_finished(lambda: speak(1))
+        tts.on_finished(lambda: speak(2))
+        self.assertEqual(calls, [])
+
+        # First utterance finished: the second callback waits for the one started by the first.
+        tts._speaking[0] = False
+        tts._run_pending()
+        self.assertEqual(calls, [1])
+
+        tts._speaking[0] = False
+        tts._run_pending()
+        self.assertEqual(calls, [1, 2])
+
+if __name__ == '__main__':
+    unittest.main()